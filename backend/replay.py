@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Replay stored Yahtzee games through the scoring engine and diff the scorecards
+
+Games logged since they were created are re-executed roll by roll and score
+by score; older games, whose log is missing or starts mid-game, only have
+their totals recalculated. Export
+the games collection as JSON lines and point the tool at the dump:
+
+    mongoexport --db test_database --collection games --out games.jsonl
+    python replay.py games.jsonl --workers 8
+
+Dumps may be gzipped, or piped in with "-" as the path.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Tuple
+
+from server import (
+    SCORING_CATEGORIES,
+    GameState,
+    Player,
+    ScoreCard,
+    YahtzeeScoring,
+    apply_roll,
+    apply_score,
+)
+
+TOTAL_FIELDS = ['upper_subtotal', 'upper_bonus', 'upper_total', 'lower_total', 'grand_total']
+
+def diff_scorecard(index: int, stored: Dict[str, Any], replayed: ScoreCard, fields: List[str]) -> List[str]:
+    replayed_values = replayed.dict()
+    return [
+        f"player {index} {field}: stored {stored.get(field)}, replayed {replayed_values[field]}"
+        for field in fields
+        if stored.get(field) != replayed_values[field]
+    ]
+
+def check_totals(game: Dict[str, Any]) -> List[str]:
+    """Recalculate the totals of a game recorded without a complete action log"""
+    diffs = []
+    for index, player in enumerate(game.get("players", [])):
+        stored = player.get("scorecard", {})
+        scorecard = ScoreCard(**{category: stored.get(category) for category in SCORING_CATEGORIES})
+        diffs.extend(diff_scorecard(index, stored, YahtzeeScoring.calculate_totals(scorecard), TOTAL_FIELDS))
+    return diffs
+
+def replay_game(game: Dict[str, Any]) -> List[str]:
+    """Re-execute a game's action log and list every difference from the stored game"""
+    if not game.get("action_log_complete"):
+        return check_totals(game)
+
+    stored_players = game.get("players", [])
+    game_state = GameState(players=[
+        Player(name=player.get("name", "Player"), is_ai=player.get("is_ai", False),
+               ai_difficulty=player.get("ai_difficulty"))
+        for player in stored_players
+    ])
+
+    for step, action in enumerate(game["action_log"]):
+        if game_state.game_over:
+            return [f"action {step}: {action[0]} after the game ended"]
+
+        if action[0] == "roll":
+            _, values, held = action
+            if game_state.rolls_remaining <= 0:
+                return [f"action {step}: roll with no rolls remaining"]
+            if any(held[i] and values[i] != game_state.dice.values[i] for i in range(5)):
+                return [f"action {step}: held dice changed from {game_state.dice.values} to {values}"]
+            apply_roll(game_state, held, values)
+        elif action[0] == "score":
+            category = action[1]
+            scorecard = game_state.players[game_state.current_player].scorecard
+            if game_state.rolls_used == 0:
+                return [f"action {step}: scored {category} before rolling"]
+            if category not in SCORING_CATEGORIES or getattr(scorecard, category) is not None:
+                return [f"action {step}: {category} is not an open category"]
+            apply_score(game_state, category)
+        else:
+            return [f"action {step}: unknown action {action[0]}"]
+
+    diffs = []
+    for index, (stored, replayed) in enumerate(zip(stored_players, game_state.players)):
+        diffs.extend(diff_scorecard(index, stored.get("scorecard", {}), replayed.scorecard,
+                                    SCORING_CATEGORIES + TOTAL_FIELDS))
+    if game.get("game_over", False) != game_state.game_over:
+        diffs.append(f"game_over: stored {game.get('game_over')}, replayed {game_state.game_over}")
+    if game.get("winner") != game_state.winner:
+        diffs.append(f"winner: stored {game.get('winner')}, replayed {game_state.winner}")
+    return diffs
+
+def well_formed(game: Any) -> bool:
+    """Whether a decoded line has the shape of a stored game, so replay only fails on engine errors"""
+    if not isinstance(game, dict):
+        return False
+    players = game.get("players", [])
+    if not isinstance(players, list) or not all(
+        isinstance(player, dict) and isinstance(player.get("scorecard", {}), dict) for player in players
+    ):
+        return False
+    action_log = game.get("action_log") or []
+    if not isinstance(action_log, list):
+        return False
+    for action in action_log:
+        if not isinstance(action, list) or not action:
+            return False
+        if action[0] == "roll" and not (
+            len(action) == 3 and all(isinstance(dice, list) and len(dice) == 5 for dice in action[1:])
+        ):
+            return False
+        if action[0] == "score" and not (len(action) == 2 and isinstance(action[1], str)):
+            return False
+    return True
+
+def replay_batch(lines: List[str]) -> Tuple[int, int, List[Tuple[str, List[str]]]]:
+    """Replay a batch of dumped games, returning (games, unreadable, mismatches)"""
+    unreadable = 0
+    mismatches = []
+    for line in lines:
+        try:
+            game = json.loads(line)
+        except ValueError:
+            unreadable += 1
+            continue
+        if not well_formed(game):
+            unreadable += 1
+            continue
+        try:
+            diffs = replay_game(game)
+        except Exception:
+            # The input was sound, so this is an engine failure: report it against the game
+            diffs = [f"engine error: {traceback.format_exc()}"]
+        if diffs:
+            mismatches.append((game.get("id", "?"), diffs))
+    return len(lines), unreadable, mismatches
+
+def read_dump(path: str) -> Iterator[str]:
+    if path == "-":
+        stream = sys.stdin
+    elif path.endswith(".gz"):
+        stream = gzip.open(path, "rt")
+    else:
+        stream = open(path)
+    with stream:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+
+def batches(lines: Iterator[str], size: int) -> Iterator[List[str]]:
+    while True:
+        batch = list(islice(lines, size))
+        if not batch:
+            return
+        yield batch
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay dumped Yahtzee games and diff the scorecards")
+    parser.add_argument("dump", help="JSON lines dump of the games collection, optionally gzipped, or - for stdin")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-diffs", type=int, default=20, help="Mismatched games to print in full")
+    args = parser.parse_args()
+
+    games = 0
+    unreadable = 0
+    mismatched = 0
+
+    def collect(futures):
+        nonlocal games, unreadable, mismatched
+        for future in futures:
+            batch_games, batch_unreadable, mismatches = future.result()
+            games += batch_games
+            unreadable += batch_unreadable
+            for game_id, diffs in mismatches:
+                mismatched += 1
+                if mismatched <= args.max_diffs:
+                    print(f"❌ {game_id}")
+                    for diff in diffs:
+                        print(f"    {diff}")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # Keep a bounded number of batches in flight so the dump is streamed, never loaded whole
+        pending = set()
+        for batch in batches(read_dump(args.dump), args.batch_size):
+            if len(pending) >= args.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(replay_batch, batch))
+        collect(wait(pending).done)
+    elapsed = time.perf_counter() - start
+
+    print("=" * 50)
+    print(f"📊 Replayed {games} games in {elapsed:.2f}s ({games / elapsed if elapsed else 0:.0f} games/s, {args.workers} workers)")
+    print(f"   Mismatched: {mismatched}, unreadable: {unreadable}")
+    return 1 if mismatched or unreadable else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
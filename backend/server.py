@@ -1,32 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import json
 import logging
+import asyncio
+import math
+import struct
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, NamedTuple
 import uuid
 from datetime import datetime
 import random
-from collections import Counter
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+from itertools import combinations, combinations_with_replacement
+from contextlib import asynccontextmanager
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection, opened on first use so importing this module stays cheap
+client = None
+db = None
 
-# Create the main app without a prefix
-app = FastAPI()
+def get_db():
+    global client, db
+    if db is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+    return db
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Yahtzee Models
+MAX_PLAYERS = 8
+MAX_AI_PLAYERS = 4
+
 class Dice(BaseModel):
     values: List[int] = Field(default_factory=lambda: [1, 1, 1, 1, 1])
     held: List[bool] = Field(default_factory=lambda: [False, False, False, False, False])
@@ -61,6 +77,9 @@ class Player(BaseModel):
     name: str = "Player"
     scorecard: ScoreCard = Field(default_factory=ScoreCard)
     is_active: bool = False
+    is_ai: bool = False
+    ai_difficulty: Optional[str] = None  # "random", "greedy" or "expected_value"
+    profile_id: Optional[str] = None  # Links human players to their lifetime stats
 
 class GameState(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -73,6 +92,9 @@ class GameState(BaseModel):
     game_mode: str = "single"  # "single" or "multiplayer"
     game_over: bool = False
     winner: Optional[str] = None
+    version: int = 0  # Bumped on every change, drives the ETag
+    action_log: List[list] = Field(default_factory=list)  # ["roll", values, held] or ["score", category]
+    action_log_complete: bool = False  # Logged since creation; games older than the log are partial
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class HighScore(BaseModel):
@@ -82,9 +104,17 @@ class HighScore(BaseModel):
     game_mode: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class AIPlayerCreate(BaseModel):
+    name: str = "Computer"
+    difficulty: str = "greedy"
+
 class GameCreate(BaseModel):
     game_mode: str
     player_names: List[str]
+    # Stable ids chosen by the client, matched to player_names by position; only
+    # players with one get lifetime stats
+    profile_ids: List[Optional[str]] = Field(default_factory=list, max_length=MAX_PLAYERS)
+    ai_players: List[AIPlayerCreate] = Field(default_factory=list, max_length=MAX_AI_PLAYERS)
 
 class RollDiceRequest(BaseModel):
     game_id: str
@@ -99,6 +129,16 @@ class HighScoreCreate(BaseModel):
     score: int
     game_mode: str
 
+class PlayerStats(BaseModel):
+    id: str
+    name: str
+    games_played: int = 0
+    mean_score: float = 0.0
+    score_variance: float = 0.0
+    category_averages: Dict[str, float] = Field(default_factory=dict)
+    bonus_rate: float = 0.0
+    yahtzee_count: int = 0
+
 # Yahtzee Scoring Logic
 class YahtzeeScoring:
     @staticmethod
@@ -220,46 +260,886 @@ class YahtzeeScoring:
         
         return scorecard
 
+SCORING_CATEGORIES = ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes',
+                      'three_of_a_kind', 'four_of_a_kind', 'full_house',
+                      'small_straight', 'large_straight', 'yahtzee', 'chance']
+
+# Game engine
+def apply_roll(game_state: GameState, held_dice: List[bool], values: Optional[List[int]] = None) -> GameState:
+    """Roll the dice that are not held and use up one roll, or replay a logged roll's values"""
+    if values is not None:
+        game_state.dice.values = list(values)
+    else:
+        # Roll non-held dice only
+        for i in range(5):
+            if not held_dice[i]:
+                game_state.dice.values[i] = random.randint(1, 6)
+    game_state.action_log.append(["roll", list(game_state.dice.values), list(held_dice)])
+    
+    # Update held dice state
+    game_state.dice.held = held_dice.copy()
+    
+    # Update roll counters
+    game_state.rolls_remaining -= 1
+    game_state.rolls_used += 1
+    return game_state
+
+def apply_score(game_state: GameState, category: str) -> GameState:
+    """Score a category for the current player and advance to the next turn"""
+    current_player = game_state.players[game_state.current_player]
+    game_state.action_log.append(["score", category])
+    
+    # Calculate score
+    score = YahtzeeScoring.get_possible_score(game_state.dice.values, category)
+    
+    # Set score
+    setattr(current_player.scorecard, category, score)
+    
+    # Calculate totals
+    current_player.scorecard = YahtzeeScoring.calculate_totals(current_player.scorecard)
+    
+    # Check if game is over
+    game_over = True
+    for player in game_state.players:
+        for name in SCORING_CATEGORIES:
+            if getattr(player.scorecard, name) is None:
+                game_over = False
+                break
+        if not game_over:
+            break
+    
+    if game_over:
+        game_state.game_over = True
+        # Find winner
+        max_score = max(player.scorecard.grand_total for player in game_state.players)
+        winner = next(player for player in game_state.players if player.scorecard.grand_total == max_score)
+        game_state.winner = winner.name
+    else:
+        # Next player's turn
+        game_state.current_player = (game_state.current_player + 1) % len(game_state.players)
+        if game_state.current_player == 0:
+            game_state.turn_number += 1
+        
+        # Reset for next turn - don't auto-roll
+        game_state.dice.values = [1, 1, 1, 1, 1]  # Default values
+        game_state.dice.held = [False] * 5
+        game_state.rolls_remaining = 3
+        game_state.rolls_used = 0
+    return game_state
+
+# AI Opponents
+AI_DIFFICULTIES = ("random", "greedy", "expected_value")
+AI_MOVE_BUDGET_MS = float(os.environ.get('AI_MOVE_BUDGET_MS', '50'))
+
+# Rough average score of each category over a game, so the AI can tell a
+# good use of a category from wasting it
+CATEGORY_BASELINES = [2.1, 5.3, 8.6, 12.2, 15.7, 19.2, 21.7, 13.1, 22.6, 29.5, 32.7, 16.9, 22.0]
+
+# Every distinct set of five dice, sorted
+DICE_COMBINATIONS = list(combinations_with_replacement(range(1, 7), 5))
+COMBINATION_INDEX = {combo: i for i, combo in enumerate(DICE_COMBINATIONS)}
+
+# Score of each combination in each category, flattened row by row. Analysis
+# workers attach to the parent's copy in shared memory instead of building it.
+_score_table = None
+_score_table_block = None
+
+def build_score_table() -> bytes:
+    return bytes(
+        YahtzeeScoring.get_possible_score(list(combo), category)
+        for combo in DICE_COMBINATIONS
+        for category in SCORING_CATEGORIES
+    )
+
+def score_table():
+    global _score_table
+    if _score_table is None:
+        _score_table = build_score_table()
+    return _score_table
+
+def _roll_outcomes(dice_count: int) -> List[tuple]:
+    """Every sorted outcome of rolling dice_count dice, with its probability"""
+    outcomes = []
+    for combo in combinations_with_replacement(range(1, 7), dice_count):
+        arrangements = math.factorial(dice_count)
+        for count in Counter(combo).values():
+            arrangements //= math.factorial(count)
+        outcomes.append((combo, arrangements / 6 ** dice_count))
+    return outcomes
+
+ROLL_OUTCOMES = [_roll_outcomes(dice_count) for dice_count in range(6)]
+
+class AIBudgetExceeded(Exception):
+    """Raised when an AI decision runs past its CPU budget"""
+
+class YahtzeeAI:
+    @staticmethod
+    def open_categories(scorecard: ScoreCard) -> List[int]:
+        return [i for i, category in enumerate(SCORING_CATEGORIES) if getattr(scorecard, category) is None]
+    
+    @staticmethod
+    def held_for(dice_values: List[int], keep: tuple) -> List[bool]:
+        """Turn a multiset of dice values to keep into a held flag per die"""
+        remaining = Counter(keep)
+        held = []
+        for value in dice_values:
+            held.append(remaining[value] > 0)
+            remaining[value] -= 1
+        return held
+    
+    @staticmethod
+    def choose_category(dice_values: List[int], open_categories: List[int]) -> str:
+        """Pick the open category that scores best relative to its typical value"""
+        table = score_table()
+        row = COMBINATION_INDEX[tuple(sorted(dice_values))] * len(SCORING_CATEGORIES)
+        best = max(open_categories, key=lambda c: table[row + c] - CATEGORY_BASELINES[c])
+        return SCORING_CATEGORIES[best]
+    
+    @staticmethod
+    def random_hold(dice_values: List[int], rolls_remaining: int, open_categories: List[int],
+                    deadline: float) -> Optional[List[bool]]:
+        if random.random() < 0.25:
+            return None
+        return [random.random() < 0.5 for _ in range(5)]
+    
+    @staticmethod
+    def greedy_hold(dice_values: List[int], rolls_remaining: int, open_categories: List[int],
+                    deadline: float) -> Optional[List[bool]]:
+        """Keep the most common face, preferring higher faces on ties"""
+        counts = Counter(dice_values)
+        face, count = max(counts.items(), key=lambda item: (item[1], item[0]))
+        if count == 5:
+            return None
+        return [value == face for value in dice_values]
+    
+    @staticmethod
+    def keep_values(dice_values: List[int], rolls_remaining: int, open_categories: List[int],
+                    deadline: float) -> Dict[tuple, float]:
+        """Expected best category value at the end of the turn for each set of dice to keep"""
+        table = score_table()
+        categories = len(SCORING_CATEGORIES)
+        final_values = [
+            max(table[row * categories + c] - CATEGORY_BASELINES[c] for c in open_categories)
+            for row in range(len(DICE_COMBINATIONS))
+        ]
+        
+        def expected(keep: tuple, values: List[float], memo: Dict[tuple, float]) -> float:
+            if keep not in memo:
+                if time.perf_counter() > deadline:
+                    raise AIBudgetExceeded()
+                memo[keep] = sum(
+                    probability * values[COMBINATION_INDEX[tuple(sorted(keep + outcome))]]
+                    for outcome, probability in ROLL_OUTCOMES[5 - len(keep)]
+                )
+            return memo[keep]
+        
+        def keeps(combo: tuple) -> set:
+            return {kept for size in range(6) for kept in combinations(combo, size)}
+        
+        # With two rolls left, value each set of dice by the best keep for the last roll
+        values = final_values
+        if rolls_remaining >= 2:
+            memo: Dict[tuple, float] = {}
+            values = [max(expected(keep, final_values, memo) for keep in keeps(combo))
+                      for combo in DICE_COMBINATIONS]
+        
+        memo = {}
+        return {keep: expected(keep, values, memo) for keep in keeps(tuple(sorted(dice_values)))}
+    
+    @staticmethod
+    def expected_value_hold(dice_values: List[int], rolls_remaining: int, open_categories: List[int],
+                            deadline: float) -> Optional[List[bool]]:
+        """Keep the dice that maximize the expected best category value at the end of the turn"""
+        values = YahtzeeAI.keep_values(dice_values, rolls_remaining, open_categories, deadline)
+        best_keep = max(values, key=values.get)
+        if best_keep == tuple(sorted(dice_values)):
+            return None
+        return YahtzeeAI.held_for(dice_values, best_keep)
+    
+    @staticmethod
+    def play_turn(game_state: GameState, budget_ms: float = AI_MOVE_BUDGET_MS) -> GameState:
+        """Play the current AI player's whole turn"""
+        player = game_state.players[game_state.current_player]
+        open_categories = YahtzeeAI.open_categories(player.scorecard)
+        choose_hold = {
+            'random': YahtzeeAI.random_hold,
+            'greedy': YahtzeeAI.greedy_hold,
+            'expected_value': YahtzeeAI.expected_value_hold,
+        }.get(player.ai_difficulty, YahtzeeAI.greedy_hold)
+        
+        apply_roll(game_state, [False] * 5)
+        while game_state.rolls_remaining > 0:
+            deadline = time.perf_counter() + budget_ms / 1000
+            try:
+                held = choose_hold(game_state.dice.values, game_state.rolls_remaining, open_categories, deadline)
+            except AIBudgetExceeded:
+                # Out of time for this move, fall back to the cheap strategy
+                held = YahtzeeAI.greedy_hold(game_state.dice.values, game_state.rolls_remaining,
+                                             open_categories, deadline)
+            if held is None:
+                break
+            apply_roll(game_state, held)
+        
+        if player.ai_difficulty == 'random':
+            category = SCORING_CATEGORIES[random.choice(open_categories)]
+        else:
+            category = YahtzeeAI.choose_category(game_state.dice.values, open_categories)
+        return apply_score(game_state, category)
+    
+    @staticmethod
+    def play_turns(game_state: GameState) -> GameState:
+        """Play AI turns until a human is up or the game ends"""
+        while not game_state.game_over and game_state.players[game_state.current_player].is_ai:
+            YahtzeeAI.play_turn(game_state)
+        return game_state
+
+    @staticmethod
+    def analyze(dice_values: List[int], rolls_remaining: int, open_categories: List[int],
+                budget_ms: float) -> Dict[str, Any]:
+        """Rank every keep for the current dice and recommend a hold and a category"""
+        deadline = time.perf_counter() + budget_ms / 1000
+        analysis = {"recommended_category": YahtzeeAI.choose_category(dice_values, open_categories)}
+        if rolls_remaining > 0:
+            values = YahtzeeAI.keep_values(dice_values, rolls_remaining, open_categories, deadline)
+            ranked = sorted(values.items(), key=lambda item: item[1], reverse=True)
+            analysis["recommended_hold"] = YahtzeeAI.held_for(dice_values, ranked[0][0])
+            analysis["keeps"] = [{"keep": list(keep), "expected_value": round(value, 2)}
+                                 for keep, value in ranked]
+        return analysis
+
+# CPU-bound work offload
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', '2'))
+ANALYSIS_TIMEOUT_S = float(os.environ.get('ANALYSIS_TIMEOUT_S', '5'))
+ANALYSIS_BUDGET_MS = float(os.environ.get('ANALYSIS_BUDGET_MS', '2000'))
+ANALYSIS_MAX_PENDING = int(os.environ.get('ANALYSIS_MAX_PENDING', str(ANALYSIS_WORKERS * 4)))
+# AI turns get workers of their own so they never queue behind analysis requests,
+# one per core so bot games on different cores do not wait for each other
+AI_WORKERS = int(os.environ.get('AI_WORKERS', str(os.cpu_count() or 2)))
+# Allowance for queueing behind other games' AI turns on top of the move budgets
+AI_TURNS_MARGIN_S = float(os.environ.get('AI_TURNS_MARGIN_S', '2'))
+
+def _attach_score_table(name: str):
+    """Worker initializer: use the parent's score table instead of building one"""
+    global _score_table, _score_table_block
+    # Keep the block referenced for the worker's lifetime, or its buffer is released
+    _score_table_block = shared_memory.SharedMemory(name=name)
+    _score_table = _score_table_block.buf
+
+def publish_score_table() -> str:
+    """Copy the score table into shared memory once, returning the block name for workers"""
+    global _score_table_block
+    if _score_table_block is None:
+        table = score_table()
+        _score_table_block = shared_memory.SharedMemory(create=True, size=len(table))
+        _score_table_block.buf[:len(table)] = table
+    return _score_table_block.name
+
+def release_score_table():
+    global _score_table_block
+    if _score_table_block is None:
+        return
+    _score_table_block.close()
+    _score_table_block.unlink()
+    _score_table_block = None
+
+class AnalysisPool:
+    """Runs CPU-bound work in worker processes that share the precomputed tables"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.finished = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._executor = None
+
+    async def warm(self):
+        """Start every worker now rather than on the first requests"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, os.getpid) for _ in range(self.workers)))
+
+    def start(self):
+        if self._executor is not None:
+            return
+        # Spawn rather than fork: the server process is running threads and an event loop
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context("spawn"),
+            initializer=_attach_score_table,
+            initargs=(publish_score_table(),)
+        )
+
+    def restart(self, broken: ProcessPoolExecutor):
+        """Replace an executor whose worker died; requests that saw the same failure restart it once"""
+        if self._executor is not broken:
+            return
+        logger.error("Analysis worker died, restarting the pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.restarts += 1
+
+    async def run(self, fn, *args, timeout: Optional[float] = None, shed: bool = False):
+        """Run fn in a worker; with shed, refuse work instead of queueing behind a full pool"""
+        if shed and self.pending >= self.max_pending:
+            self.rejected += 1
+            raise too_many_requests("Analysis workers are busy", 1.0)
+        
+        self.pending += 1
+        try:
+            # Retry once on a fresh pool if a worker crashed or was killed mid-task
+            for _ in range(2):
+                self.start()
+                executor = self._executor
+                try:
+                    # Cancelling the wrapped future also cancels the task if it has not started yet
+                    return await asyncio.wait_for(asyncio.wrap_future(executor.submit(fn, *args)), timeout)
+                except BrokenProcessPool:
+                    self.restart(executor)
+            raise HTTPException(status_code=503, detail="Analysis workers are unavailable")
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=504, detail="Worker timed out")
+        finally:
+            self.pending -= 1
+            self.finished += 1
+
+    def shutdown(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "finished": self.finished,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+analysis_pool = AnalysisPool(ANALYSIS_WORKERS, ANALYSIS_MAX_PENDING)
+ai_pool = AnalysisPool(AI_WORKERS, ANALYSIS_MAX_PENDING)
+
+def ai_turns_timeout(game_state: GameState) -> float:
+    """Longest play_turns can take with every move using its full budget"""
+    ai_players = sum(1 for player in game_state.players if player.is_ai)
+    # Without a human to hand the turn to, the bots play out the rest of the game in one go
+    rounds = 1 if ai_players < len(game_state.players) else len(SCORING_CATEGORIES)
+    # A turn is at most three rolls, each chosen within the move budget
+    return ai_players * rounds * 3 * AI_MOVE_BUDGET_MS / 1000 + AI_TURNS_MARGIN_S
+
+async def run_ai_turns(game_state: GameState) -> GameState:
+    """Play any pending AI turns in the worker pool so the event loop stays free"""
+    if game_state.game_over or not game_state.players[game_state.current_player].is_ai:
+        return game_state
+    return await ai_pool.run(YahtzeeAI.play_turns, game_state, timeout=ai_turns_timeout(game_state))
+
+# Rate limiting and backpressure
+RATE_LIMIT_CLIENT_RATE = float(os.environ.get('RATE_LIMIT_CLIENT_RATE', '10'))
+RATE_LIMIT_CLIENT_BURST = float(os.environ.get('RATE_LIMIT_CLIENT_BURST', '20'))
+RATE_LIMIT_GAME_RATE = float(os.environ.get('RATE_LIMIT_GAME_RATE', '5'))
+RATE_LIMIT_GAME_BURST = float(os.environ.get('RATE_LIMIT_GAME_BURST', '10'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000'))
+GAME_QUEUE_DEPTH = int(os.environ.get('GAME_QUEUE_DEPTH', '4'))
+# Proxies in front of the server that append to X-Forwarded-For, 0 when exposed directly
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '1'))
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+class RateLimiter:
+    """Token buckets keyed by client or game, evicting the least recently used key"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.rejected = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """Take a token for key; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # A bucket evicted while idle would have refilled anyway, so LRU eviction is lossless
+            bucket = TokenBucket(self.burst, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        self.rejected += 1
+        return (1 - bucket.tokens) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class GameRequestQueue:
+    """Runs requests for the same game one at a time, rejecting them once too many are waiting"""
+
+    def __init__(self, max_depth: int):
+        self.max_depth = max_depth
+        self.rejected = 0
+        self._depth: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @asynccontextmanager
+    async def slot(self, game_id: str):
+        depth = self._depth.get(game_id, 0)
+        if depth >= self.max_depth:
+            self.rejected += 1
+            raise too_many_requests("Too many pending requests for this game", 1.0)
+        
+        self._depth[game_id] = depth + 1
+        lock = self._locks.setdefault(game_id, asyncio.Lock())
+        try:
+            async with lock:
+                yield
+        finally:
+            # Drop per-game state as soon as nothing is queued so idle games cost nothing
+            remaining = self._depth[game_id] - 1
+            if remaining:
+                self._depth[game_id] = remaining
+            else:
+                del self._depth[game_id]
+                del self._locks[game_id]
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+def client_address(request: Request) -> str:
+    """Identify the caller by the address our own proxy saw, which the client cannot forge"""
+    if TRUSTED_PROXY_HOPS:
+        # Entries left of the ones our proxies appended are written by the client
+        forwarded_for = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",") if entry.strip()]
+        if len(forwarded_for) >= TRUSTED_PROXY_HOPS:
+            return forwarded_for[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+client_limiter = RateLimiter(RATE_LIMIT_CLIENT_RATE, RATE_LIMIT_CLIENT_BURST, RATE_LIMIT_MAX_KEYS)
+game_limiter = RateLimiter(RATE_LIMIT_GAME_RATE, RATE_LIMIT_GAME_BURST, RATE_LIMIT_MAX_KEYS)
+game_queue = GameRequestQueue(GAME_QUEUE_DEPTH)
+
+async def client_rate_limit(request: Request):
+    """Throttle per client"""
+    retry_after = client_limiter.acquire(client_address(request))
+    if retry_after:
+        raise too_many_requests("Rate limit exceeded", retry_after)
+
+async def read_rate_limit(request: Request, game_id: str):
+    """Throttle per client and per game, for requests that only read the game"""
+    await client_rate_limit(request)
+    
+    retry_after = game_limiter.acquire(game_id)
+    if retry_after:
+        raise too_many_requests("Rate limit exceeded for this game", retry_after)
+
+async def rate_limit(request: Request, game_id: str):
+    """Throttle per client and per game, then hold the game's queue slot for the request"""
+    await read_rate_limit(request, game_id)
+    
+    async with game_queue.slot(game_id):
+        yield
+
+# Binary wire format
+# A fixed little-endian layout for bot clients. It carries everything that
+# changes during play and leaves out ids, names and timestamps, which a client
+# reads once from the JSON representation.
+#
+# Game:   header, then one record per player
+#   header  u8 format, u32 version, u8 flags (1 game over, 2 multiplayer),
+#           u8 current player, u8 rolls remaining, u8 rolls used, u8 turn,
+#           u8 winner index (255 for none), u8 player count,
+#           5 x u8 dice, u8 held bitmask
+#   player  u8 flags (1 active, 2 AI), 13 x i8 category scores (-1 for open),
+#           5 x u16 upper subtotal, upper bonus, upper total, lower total, grand total
+# Possible scores: 13 x i8 in category order, -1 where the category is not available
+BINARY_MEDIA_TYPE = "application/x-yahtzee"
+BINARY_FORMAT_VERSION = 1
+BINARY_GAME_HEADER = struct.Struct("<BIBBBBBBB5BB")
+BINARY_PLAYER = struct.Struct("<B13b5H")
+BINARY_POSSIBLE_SCORES = struct.Struct("<13b")
+SCORECARD_TOTALS = ['upper_subtotal', 'upper_bonus', 'upper_total', 'lower_total', 'grand_total']
+NO_WINNER = 255
+
+def accept_quality(params: List[str]) -> float:
+    """The q-value of one Accept media range, 1 when absent and 0 when unparseable"""
+    for param in params:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return min(max(float(value), 0.0), 1.0)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+def accepts_binary(request: Request) -> bool:
+    """Whether the client ranks the binary encoding at least as high as JSON"""
+    quality = {}
+    for media_range in request.headers.get("accept", "").split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        quality.setdefault(media_type.lower(), accept_quality(params))
+    # Binary is only ever sent when asked for by name; wildcards stand for JSON
+    binary = quality.get(BINARY_MEDIA_TYPE, 0.0)
+    json_quality = next((quality[media_type] for media_type in ("application/json", "application/*", "*/*")
+                         if media_type in quality), 0.0)
+    return binary > 0 and binary >= json_quality
+
+def encode_game_binary(game_state: GameState) -> bytes:
+    # Player indexes are single bytes, with 255 reserved for no winner
+    if len(game_state.players) >= NO_WINNER:
+        raise ValueError(f"Binary format holds at most {NO_WINNER - 1} players")
+    winner = NO_WINNER
+    if game_state.winner is not None:
+        winner = next((i for i, player in enumerate(game_state.players) if player.name == game_state.winner), NO_WINNER)
+    held = sum(1 << i for i, is_held in enumerate(game_state.dice.held) if is_held)
+    flags = (1 if game_state.game_over else 0) | (2 if game_state.game_mode == "multiplayer" else 0)
+    
+    parts = [BINARY_GAME_HEADER.pack(
+        BINARY_FORMAT_VERSION, game_state.version, flags, game_state.current_player,
+        game_state.rolls_remaining, game_state.rolls_used, game_state.turn_number,
+        winner, len(game_state.players), *game_state.dice.values, held
+    )]
+    for player in game_state.players:
+        scorecard = player.scorecard
+        parts.append(BINARY_PLAYER.pack(
+            (1 if player.is_active else 0) | (2 if player.is_ai else 0),
+            *[-1 if getattr(scorecard, category) is None else getattr(scorecard, category)
+              for category in SCORING_CATEGORIES],
+            *[getattr(scorecard, total) for total in SCORECARD_TOTALS]
+        ))
+    return b"".join(parts)
+
+def decode_game_binary(body: bytes) -> Dict[str, Any]:
+    """Decode the binary game layout into the same shape as the JSON fields it carries"""
+    (format_version, version, flags, current_player, rolls_remaining, rolls_used,
+     turn_number, winner, player_count, *rest) = BINARY_GAME_HEADER.unpack_from(body)
+    if format_version != BINARY_FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary format version: {format_version}")
+    dice, held = rest[:5], rest[5]
+    
+    players = []
+    for offset in range(BINARY_GAME_HEADER.size, BINARY_GAME_HEADER.size + player_count * BINARY_PLAYER.size,
+                        BINARY_PLAYER.size):
+        player_flags, *values = BINARY_PLAYER.unpack_from(body, offset)
+        scorecard = {category: None if score < 0 else score
+                     for category, score in zip(SCORING_CATEGORIES, values[:13])}
+        scorecard.update(zip(SCORECARD_TOTALS, values[13:]))
+        players.append({"is_active": bool(player_flags & 1), "is_ai": bool(player_flags & 2), "scorecard": scorecard})
+    
+    return {
+        "version": version,
+        "game_over": bool(flags & 1),
+        "game_mode": "multiplayer" if flags & 2 else "single",
+        "current_player": current_player,
+        "rolls_remaining": rolls_remaining,
+        "rolls_used": rolls_used,
+        "turn_number": turn_number,
+        "winner_index": None if winner == NO_WINNER else winner,
+        "dice": {"values": list(dice), "held": [bool(held & (1 << i)) for i in range(5)]},
+        "players": players,
+    }
+
+def encode_possible_scores_binary(game_state: GameState) -> bytes:
+    possible_scores = possible_scores_for(game_state)
+    return BINARY_POSSIBLE_SCORES.pack(*[possible_scores.get(category, -1) for category in SCORING_CATEGORIES])
+
+def decode_possible_scores_binary(body: bytes) -> Dict[str, int]:
+    return {category: score
+            for category, score in zip(SCORING_CATEGORIES, BINARY_POSSIBLE_SCORES.unpack(body))
+            if score >= 0}
+
+# Response caching
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '2048'))
+
+class ResponseCache:
+    """Serialized responses for the latest version of each game, evicting the least recently used"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def get(self, key: tuple, version: int) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: tuple, version: int, body: bytes):
+        self._entries[key] = (version, body)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        served_cheaply = self.hits + self.not_modified
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": served_cheaply / self.requests if self.requests else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "entries": len(self._entries),
+        }
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+def game_etag(game_id: str, version: int, kind: str) -> str:
+    return f'"{game_id}.{version}.{kind}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match, which uses weak comparison"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def possible_scores_for(game_state: GameState) -> Dict[str, int]:
+    current_player = game_state.players[game_state.current_player]
+    
+    # Only return possible scores if at least one roll has been used
+    if game_state.rolls_used == 0:
+        return {}
+    
+    possible_scores = {}
+    for category in SCORING_CATEGORIES:
+        if getattr(current_player.scorecard, category) is None:
+            possible_scores[category] = YahtzeeScoring.get_possible_score(game_state.dice.values, category)
+    
+    return possible_scores
+
+def serialize_game(game_state: GameState) -> bytes:
+    # The action log is for replaying games offline, clients never need it
+    return game_state.json(exclude={"action_log", "action_log_complete"}).encode()
+
+def serialize_possible_scores(game_state: GameState) -> bytes:
+    return json.dumps(possible_scores_for(game_state)).encode()
+
+class Representation(NamedTuple):
+    kind: str
+    render: Callable[[GameState], bytes]
+    media_type: str
+
+GAME_JSON = Representation("game", serialize_game, "application/json")
+GAME_BINARY = Representation("game.bin", encode_game_binary, BINARY_MEDIA_TYPE)
+POSSIBLE_SCORES_JSON = Representation("possible-scores", serialize_possible_scores, "application/json")
+POSSIBLE_SCORES_BINARY = Representation("possible-scores.bin", encode_possible_scores_binary, BINARY_MEDIA_TYPE)
+
+def representation_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Vary": "Accept"}
+
+def game_response(game_state: GameState, request: Optional[Request] = None) -> Response:
+    """Serialize a freshly changed game, priming the cache for the pollers that follow"""
+    representation = GAME_BINARY if request is not None and accepts_binary(request) else GAME_JSON
+    body = representation.render(game_state)
+    response_cache.put((representation.kind, game_state.id), game_state.version, body)
+    etag = game_etag(game_state.id, game_state.version, representation.kind)
+    return Response(content=body, media_type=representation.media_type, headers=representation_headers(etag))
+
+async def save_game(game_state: GameState):
+    """Write the game only if no other request or server process changed it since it was read"""
+    expected = game_state.version
+    game_state.version += 1
+    # Games stored before versioning have no version field at all
+    version_filter = expected if expected else {"$in": [0, None]}
+    result = await get_db().games.replace_one({"id": game_state.id, "version": version_filter}, game_state.dict())
+    if result.matched_count == 0:
+        raise HTTPException(status_code=409, detail="Game was changed by another request, reload and retry")
+
+async def cached_game_read(request: Request, game_id: str, representation: Representation) -> Response:
+    """Serve a game read from the cache, or 304 when the client already has this version"""
+    response_cache.requests += 1
+    current = await get_db().games.find_one({"id": game_id}, {"version": 1})
+    if not current:
+        raise HTTPException(status_code=404, detail="Game not found")
+    
+    kind = representation.kind
+    version = current.get("version", 0)
+    etag = game_etag(game_id, version, kind)
+    body = response_cache.get((kind, game_id), version)
+    if etag_matches(request, etag):
+        response_cache.not_modified += 1
+        if body is not None:
+            response_cache.bytes_saved += len(body)
+        return Response(status_code=304, headers=representation_headers(etag))
+    
+    if body is not None:
+        response_cache.hits += 1
+    else:
+        response_cache.misses += 1
+        game = await get_db().games.find_one({"id": game_id})
+        if not game:
+            raise HTTPException(status_code=404, detail="Game not found")
+        game_state = GameState(**game)
+        body = representation.render(game_state)
+        # The game may have moved on since the version check, so key by what was rendered
+        response_cache.put((kind, game_id), game_state.version, body)
+        etag = game_etag(game_id, game_state.version, kind)
+    
+    return Response(content=body, media_type=representation.media_type, headers=representation_headers(etag))
+
+# Player statistics
+MAX_PROFILE_ID_LENGTH = 64
+
+def profile_update(player: Player) -> List[Dict[str, Any]]:
+    """Update pipeline folding one finished game into a player's profile"""
+    scorecard = player.scorecard
+    score = scorecard.grand_total
+    
+    def increment(field: str, amount: int) -> Dict[str, Any]:
+        return {"$add": [{"$ifNull": [f"${field}", 0]}, amount]}
+    
+    # Welford's running mean and sum of squared deviations. Every expression in
+    # the stage sees the profile as it was, so both old and new mean are at hand.
+    games_played = increment("games_played", 1)
+    mean = {"$ifNull": ["$mean_score", 0]}
+    new_mean = {"$add": [mean, {"$divide": [{"$subtract": [score, mean]}, games_played]}]}
+    m2 = {"$add": [
+        {"$ifNull": ["$m2_score", 0]},
+        {"$multiply": [{"$subtract": [score, mean]}, {"$subtract": [score, new_mean]}]}
+    ]}
+    
+    fields = {
+        "name": {"$literal": player.name},
+        "games_played": games_played,
+        "mean_score": new_mean,
+        "m2_score": m2,
+        "bonus_count": increment("bonus_count", 1 if scorecard.upper_bonus else 0),
+        "yahtzee_count": increment("yahtzee_count", 1 if scorecard.yahtzee == 50 else 0),
+        "updated_at": datetime.utcnow(),
+    }
+    for category in SCORING_CATEGORIES:
+        fields[f"category_totals.{category}"] = increment(f"category_totals.{category}",
+                                                          getattr(scorecard, category) or 0)
+    return [{"$set": fields}]
+
+async def upsert_profile(player: Player):
+    from pymongo.errors import DuplicateKeyError
+    profiles = get_db().player_profiles
+    query = {"id": player.profile_id}
+    try:
+        await profiles.update_one(query, profile_update(player), upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first game created the profile; it exists now, so the retry updates it
+        await profiles.update_one(query, profile_update(player), upsert=True)
+
+async def record_player_stats(game_state: GameState):
+    """Fold a finished game into the profile of every human player who has one"""
+    for player in game_state.players:
+        if player.is_ai or not player.profile_id:
+            continue
+        # The score is already saved, so a failed profile update must not fail the request
+        try:
+            await upsert_profile(player)
+        except Exception:
+            logger.exception(f"Could not update stats for player {player.name} in game {game_state.id}")
+
+def player_stats(profile: Dict[str, Any]) -> PlayerStats:
+    games_played = profile.get("games_played", 0)
+    if not games_played:
+        return PlayerStats(id=profile["id"], name=profile.get("name", profile["id"]))
+    
+    category_totals = profile.get("category_totals", {})
+    return PlayerStats(
+        id=profile["id"],
+        name=profile.get("name", profile["id"]),
+        games_played=games_played,
+        mean_score=profile.get("mean_score", 0.0),
+        score_variance=profile.get("m2_score", 0.0) / (games_played - 1) if games_played > 1 else 0.0,
+        category_averages={
+            category: category_totals.get(category, 0) / games_played for category in SCORING_CATEGORIES
+        },
+        bonus_rate=profile.get("bonus_count", 0) / games_played,
+        yahtzee_count=profile.get("yahtzee_count", 0)
+    )
+
 # API Endpoints
 @api_router.get("/")
 async def root():
     return {"message": "Yahtzee Game API"}
 
-@api_router.post("/games", response_model=GameState)
+@api_router.post("/games", response_model=GameState, dependencies=[Depends(client_rate_limit)])
 async def create_game(game_create: GameCreate):
     """Create a new Yahtzee game"""
+    if len(game_create.player_names) + len(game_create.ai_players) > MAX_PLAYERS:
+        raise HTTPException(status_code=400, detail=f"Game can have at most {MAX_PLAYERS} players")
+    for ai_player in game_create.ai_players:
+        if ai_player.difficulty not in AI_DIFFICULTIES:
+            raise HTTPException(status_code=400, detail=f"Unknown AI difficulty: {ai_player.difficulty}")
+    if len(game_create.profile_ids) > len(game_create.player_names):
+        raise HTTPException(status_code=400, detail="More profile ids than players")
+    if any(profile_id is not None and not 0 < len(profile_id) <= MAX_PROFILE_ID_LENGTH
+           for profile_id in game_create.profile_ids):
+        raise HTTPException(status_code=400,
+                            detail=f"Profile ids must be 1 to {MAX_PROFILE_ID_LENGTH} characters")
+    
     players = []
     for i, name in enumerate(game_create.player_names):
-        player = Player(name=name, is_active=(i == 0))
+        profile_id = game_create.profile_ids[i] if i < len(game_create.profile_ids) else None
+        player = Player(name=name, is_active=(i == 0), profile_id=profile_id)
+        players.append(player)
+    for ai_player in game_create.ai_players:
+        player = Player(name=ai_player.name, is_active=not players, is_ai=True,
+                        ai_difficulty=ai_player.difficulty)
         players.append(player)
     
+    if not players:
+        raise HTTPException(status_code=400, detail="Game needs at least one player")
+    
     game = GameState(
         players=players,
         game_mode=game_create.game_mode,
         current_player=0,
         rolls_remaining=3,
-        rolls_used=0
+        rolls_used=0,
+        action_log_complete=True
     )
     
     # Don't roll initial dice - let player start with their first roll
     game.dice.values = [1, 1, 1, 1, 1]  # Default values
     game.dice.held = [False] * 5
+    game = await run_ai_turns(game)
     
-    await db.games.insert_one(game.dict())
-    return game
+    await get_db().games.insert_one(game.dict())
+    return game_response(game)
 
 @api_router.get("/games/{game_id}", response_model=GameState)
-async def get_game(game_id: str):
+async def get_game(game_id: str, request: Request):
     """Get game state"""
-    game = await db.games.find_one({"id": game_id})
-    if not game:
-        raise HTTPException(status_code=404, detail="Game not found")
-    return GameState(**game)
+    return await cached_game_read(request, game_id, GAME_BINARY if accepts_binary(request) else GAME_JSON)
 
-@api_router.post("/games/{game_id}/roll")
-async def roll_dice(game_id: str, roll_request: RollDiceRequest):
+@api_router.post("/games/{game_id}/roll", dependencies=[Depends(rate_limit)])
+async def roll_dice(game_id: str, roll_request: RollDiceRequest, request: Request):
     """Roll dice for current turn"""
-    game = await db.games.find_one({"id": game_id})
+    game = await get_db().games.find_one({"id": game_id})
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
     
@@ -268,25 +1148,15 @@ async def roll_dice(game_id: str, roll_request: RollDiceRequest):
     if game_state.rolls_remaining <= 0:
         raise HTTPException(status_code=400, detail="No rolls remaining")
     
-    # Roll non-held dice only
-    for i in range(5):
-        if not roll_request.held_dice[i]:
-            game_state.dice.values[i] = random.randint(1, 6)
-    
-    # Update held dice state
-    game_state.dice.held = roll_request.held_dice.copy()
-    
-    # Update roll counters
-    game_state.rolls_remaining -= 1
-    game_state.rolls_used += 1
+    apply_roll(game_state, roll_request.held_dice)
     
-    await db.games.replace_one({"id": game_id}, game_state.dict())
-    return game_state
+    await save_game(game_state)
+    return game_response(game_state, request)
 
-@api_router.post("/games/{game_id}/score")
-async def score_category(game_id: str, score_request: ScoreRequest):
+@api_router.post("/games/{game_id}/score", dependencies=[Depends(rate_limit)])
+async def score_category(game_id: str, score_request: ScoreRequest, request: Request):
     """Score a category and end turn"""
-    game = await db.games.find_one({"id": game_id})
+    game = await get_db().games.find_one({"id": game_id})
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
     
@@ -304,54 +1174,18 @@ async def score_category(game_id: str, score_request: ScoreRequest):
         if current_value is not None:
             raise HTTPException(status_code=400, detail="Category already scored")
     
-    # Calculate score
-    score = YahtzeeScoring.get_possible_score(game_state.dice.values, score_request.category)
+    apply_score(game_state, score_request.category)
+    game_state = await run_ai_turns(game_state)
     
-    # Set score
-    setattr(current_player.scorecard, score_request.category, score)
-    
-    # Calculate totals
-    current_player.scorecard = YahtzeeScoring.calculate_totals(current_player.scorecard)
-    
-    # Check if game is over
-    all_categories = ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes',
-                     'three_of_a_kind', 'four_of_a_kind', 'full_house',
-                     'small_straight', 'large_straight', 'yahtzee', 'chance']
-    
-    game_over = True
-    for player in game_state.players:
-        for category in all_categories:
-            if getattr(player.scorecard, category) is None:
-                game_over = False
-                break
-        if not game_over:
-            break
-    
-    if game_over:
-        game_state.game_over = True
-        # Find winner
-        max_score = max(player.scorecard.grand_total for player in game_state.players)
-        winner = next(player for player in game_state.players if player.scorecard.grand_total == max_score)
-        game_state.winner = winner.name
-    else:
-        # Next player's turn
-        game_state.current_player = (game_state.current_player + 1) % len(game_state.players)
-        if game_state.current_player == 0:
-            game_state.turn_number += 1
-        
-        # Reset for next turn - don't auto-roll
-        game_state.dice.values = [1, 1, 1, 1, 1]  # Default values
-        game_state.dice.held = [False] * 5
-        game_state.rolls_remaining = 3
-        game_state.rolls_used = 0
-    
-    await db.games.replace_one({"id": game_id}, game_state.dict())
-    return game_state
+    await save_game(game_state)
+    if game_state.game_over:
+        await record_player_stats(game_state)
+    return game_response(game_state, request)
 
-@api_router.post("/games/{game_id}/restart")
+@api_router.post("/games/{game_id}/restart", dependencies=[Depends(rate_limit)])
 async def restart_game(game_id: str):
     """Restart the current game"""
-    game = await db.games.find_one({"id": game_id})
+    game = await get_db().games.find_one({"id": game_id})
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
     
@@ -369,74 +1203,96 @@ async def restart_game(game_id: str):
     game_state.turn_number = 1
     game_state.game_over = False
     game_state.winner = None
+    game_state.action_log = []
+    game_state.action_log_complete = True
+    game_state = await run_ai_turns(game_state)
     
-    await db.games.replace_one({"id": game_id}, game_state.dict())
-    return game_state
+    await save_game(game_state)
+    return game_response(game_state)
 
-@api_router.get("/games/{game_id}/possible-scores")
-async def get_possible_scores(game_id: str):
+@api_router.get("/games/{game_id}/possible-scores", dependencies=[Depends(read_rate_limit)])
+async def get_possible_scores(game_id: str, request: Request):
     """Get possible scores for current dice"""
-    game = await db.games.find_one({"id": game_id})
+    representation = POSSIBLE_SCORES_BINARY if accepts_binary(request) else POSSIBLE_SCORES_JSON
+    return await cached_game_read(request, game_id, representation)
+
+@api_router.get("/games/{game_id}/analysis", dependencies=[Depends(read_rate_limit)])
+async def get_analysis(game_id: str):
+    """Expected-value analysis of the current dice for the player to move"""
+    game = await get_db().games.find_one({"id": game_id})
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
     
     game_state = GameState(**game)
-    current_player = game_state.players[game_state.current_player]
-    
-    # Only return possible scores if at least one roll has been used
     if game_state.rolls_used == 0:
-        return {}
-    
-    possible_scores = {}
-    categories = ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes',
-                 'three_of_a_kind', 'four_of_a_kind', 'full_house',
-                 'small_straight', 'large_straight', 'yahtzee', 'chance']
-    
-    for category in categories:
-        if getattr(current_player.scorecard, category) is None:
-            possible_scores[category] = YahtzeeScoring.get_possible_score(game_state.dice.values, category)
+        raise HTTPException(status_code=400, detail="Must roll dice before analysis")
     
-    return possible_scores
+    current_player = game_state.players[game_state.current_player]
+    try:
+        return await analysis_pool.run(
+            YahtzeeAI.analyze,
+            game_state.dice.values,
+            game_state.rolls_remaining,
+            YahtzeeAI.open_categories(current_player.scorecard),
+            ANALYSIS_BUDGET_MS,
+            timeout=ANALYSIS_TIMEOUT_S,
+            shed=True
+        )
+    except AIBudgetExceeded:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+
+@api_router.get("/players/{profile_id}/stats", response_model=PlayerStats)
+async def get_player_stats(profile_id: str):
+    """Lifetime statistics for a player profile"""
+    profile = await get_db().player_profiles.find_one({"id": profile_id})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Player not found")
+    return player_stats(profile)
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Cache and rate limiter counters"""
+    return {
+        "response_cache": response_cache.stats(),
+        "rate_limit": {
+            "client_rejected": client_limiter.rejected,
+            "game_rejected": game_limiter.rejected,
+            "queue_rejected": game_queue.rejected,
+            "tracked_clients": len(client_limiter),
+            "tracked_games": len(game_limiter),
+        },
+        "analysis_pool": analysis_pool.stats(),
+        "ai_pool": ai_pool.stats(),
+    }
 
 @api_router.post("/high-scores", response_model=HighScore)
 async def create_high_score(high_score: HighScoreCreate):
     """Create a new high score"""
     score_obj = HighScore(**high_score.dict())
-    await db.high_scores.insert_one(score_obj.dict())
+    await get_db().high_scores.insert_one(score_obj.dict())
     return score_obj
 
 @api_router.get("/high-scores", response_model=List[HighScore])
 async def get_high_scores():
     """Get top 10 high scores"""
-    high_scores = await db.high_scores.find().sort("score", -1).limit(10).to_list(10)
+    high_scores = await get_db().high_scores.find().sort("score", -1).limit(10).to_list(10)
     return [HighScore(**score) for score in high_scores]
 
 @api_router.get("/high-scores/check/{score}")
 async def check_high_score(score: int):
     """Check if score qualifies for high score list"""
-    count = await db.high_scores.count_documents({})
+    count = await get_db().high_scores.count_documents({})
     if count < 10:
         return {"is_high_score": True, "rank": count + 1}
     
-    lowest_high_score = await db.high_scores.find().sort("score", 1).limit(1).to_list(1)
+    lowest_high_score = await get_db().high_scores.find().sort("score", 1).limit(1).to_list(1)
     if lowest_high_score and score > lowest_high_score[0]["score"]:
         # Count how many scores are higher
-        rank = await db.high_scores.count_documents({"score": {"$gt": score}}) + 1
+        rank = await get_db().high_scores.count_documents({"score": {"$gt": score}}) + 1
         return {"is_high_score": True, "rank": rank}
     
     return {"is_high_score": False, "rank": None}
 
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -444,6 +1300,98 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
+# Startup warmup
+MONGO_RETRY_MAX_S = float(os.environ.get('MONGO_RETRY_MAX_S', '30'))
+startup_status: Dict[str, Any] = {"warm": False, "mongo": False, "steps_ms": {}}
+_warmup_task = None
+
+async def wait_for_mongo():
+    """Ping Mongo until it answers, backing off between attempts"""
+    delay = 0.5
+    while True:
+        try:
+            await get_db().command("ping")
+            await get_db().player_profiles.create_index("id", unique=True)
+            return
+        except Exception as e:
+            logger.warning(f"MongoDB is not reachable, retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MONGO_RETRY_MAX_S)
+
+async def warm_up():
+    """Build tables, start analysis workers and connect to Mongo before reporting ready"""
+    steps = startup_status["steps_ms"]
+    try:
+        started = time.perf_counter()
+        score_table()
+        steps["score_table"] = round((time.perf_counter() - started) * 1000, 1)
+        
+        started = time.perf_counter()
+        await asyncio.gather(analysis_pool.warm(), ai_pool.warm())
+        steps["worker_pools"] = round((time.perf_counter() - started) * 1000, 1)
+        
+        started = time.perf_counter()
+        await wait_for_mongo()
+        startup_status["mongo"] = True
+        steps["mongo"] = round((time.perf_counter() - started) * 1000, 1)
+    except Exception:
+        logger.exception("Warmup failed")
+        raise
+    
+    startup_status.pop("error", None)
+    startup_status["warm"] = True
+    logger.info(f"Warmup finished: {startup_status}")
+
+async def start_warm_up():
+    # Warm up in the background so the server accepts connections straight away
+    global _warmup_task
+    _warmup_task = asyncio.create_task(warm_up())
+
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if client is not None:
+        client.close()
+    analysis_pool.shutdown()
+    ai_pool.shutdown()
+    release_score_table()
+
+@api_router.get("/ready")
+async def ready():
+    """Readiness probe, 503 until warmup has finished"""
+    if _warmup_task is not None and _warmup_task.done() and not startup_status["warm"]:
+        # Warmup failed and was logged; report why and try again rather than stay unready for good
+        error = None if _warmup_task.cancelled() else _warmup_task.exception()
+        await start_warm_up()
+        startup_status["error"] = repr(error)
+    status_code = 200 if startup_status["warm"] else 503
+    return Response(content=json.dumps(startup_status), status_code=status_code, media_type="application/json")
+
+def create_app() -> FastAPI:
+    # Create the main app without a prefix
+    app = FastAPI()
+    
+    # Include the router in the main app
+    app.include_router(api_router)
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "Retry-After"],
+    )
+    
+    app.add_event_handler("startup", start_warm_up)
+    app.add_event_handler("shutdown", shutdown_db_client)
+    return app
+
+_app = None
+
+def __getattr__(name: str):
+    # Build the app when the server first asks for it, not when workers or tools import this module
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
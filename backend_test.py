@@ -4,12 +4,22 @@ Comprehensive Backend API Testing for Yahtzee Game
 Tests all API endpoints and game logic functionality
 """
 
+import asyncio
+import httpx
 import requests
 import json
+import os
+import subprocess
 import sys
 from datetime import datetime
 import time
 
+# In-process latency benchmarks pass if p99 under load stays within this factor of
+# baseline p99; baselines below the floor are raised to it so sub-millisecond noise
+# cannot fail them
+LATENCY_FACTOR = 3
+LATENCY_FLOOR_MS = 5
+
 class YahtzeeAPITester:
     def __init__(self, base_url="https://62c808a7-8625-42b0-a2cb-1659b2cee649.preview.emergentagent.com"):
         self.base_url = base_url
@@ -37,6 +47,16 @@ class YahtzeeAPITester:
         except Exception as e:
             return self.log_test("API Root", False, f"Error: {str(e)}")
 
+    def test_readiness(self):
+        """Test that the backend reports itself warm"""
+        try:
+            response = requests.get(f"{self.api_url}/ready", timeout=10)
+            data = response.json()
+            success = response.status_code == 200 and data.get('warm') is True
+            return self.log_test("Readiness", success, f"Status: {response.status_code}, warmup: {data.get('steps_ms')}")
+        except Exception as e:
+            return self.log_test("Readiness", False, f"Error: {str(e)}")
+
     def test_create_single_player_game(self):
         """Test creating a single player game"""
         try:
@@ -106,6 +126,49 @@ class YahtzeeAPITester:
         except Exception as e:
             return self.log_test("Get Game", False, f"Error: {str(e)}")
 
+    def test_etag_polling(self):
+        """Test that unchanged games answer conditional polls with 304"""
+        if not self.game_id:
+            return self.log_test("ETag Polling", False, "No game ID available")
+        
+        try:
+            response = requests.get(f"{self.api_url}/games/{self.game_id}", timeout=10)
+            etag = response.headers.get('ETag')
+            if response.status_code != 200 or not etag:
+                return self.log_test("ETag Polling", False, f"Status: {response.status_code}, ETag: {etag}")
+            
+            unchanged = requests.get(f"{self.api_url}/games/{self.game_id}",
+                                     headers={"If-None-Match": etag}, timeout=10)
+            metrics = requests.get(f"{self.api_url}/metrics", timeout=10).json()
+            success = (
+                unchanged.status_code == 304 and
+                unchanged.headers.get('ETag') == etag and
+                metrics.get('response_cache', {}).get('not_modified', 0) > 0
+            )
+            return self.log_test("ETag Polling", success, f"Conditional status: {unchanged.status_code}")
+        except Exception as e:
+            return self.log_test("ETag Polling", False, f"Error: {str(e)}")
+
+    def test_binary_game_format(self):
+        """Test that bot clients can negotiate the compact binary encoding"""
+        if not self.game_id:
+            return self.log_test("Binary Game Format", False, "No game ID available")
+        
+        try:
+            json_response = requests.get(f"{self.api_url}/games/{self.game_id}", timeout=10)
+            binary_response = requests.get(f"{self.api_url}/games/{self.game_id}",
+                                           headers={"Accept": "application/x-yahtzee"}, timeout=10)
+            success = (
+                binary_response.status_code == 200 and
+                binary_response.headers.get('Content-Type') == "application/x-yahtzee" and
+                binary_response.headers.get('ETag') != json_response.headers.get('ETag') and
+                len(binary_response.content) < len(json_response.content)
+            )
+            return self.log_test("Binary Game Format", success,
+                                 f"JSON: {len(json_response.content)} bytes, binary: {len(binary_response.content)} bytes")
+        except Exception as e:
+            return self.log_test("Binary Game Format", False, f"Error: {str(e)}")
+
     def test_roll_dice(self):
         """Test rolling dice"""
         if not self.game_id:
@@ -216,6 +279,88 @@ class YahtzeeAPITester:
         except Exception as e:
             return self.log_test("Score Category", False, f"Error: {str(e)}")
 
+    def test_ai_opponent_game(self):
+        """Test that AI players take their turns server-side after a human scores"""
+        try:
+            payload = {
+                "game_mode": "multiplayer",
+                "player_names": ["Test Player"],
+                "ai_players": [
+                    {"name": "Greedy Bot", "difficulty": "greedy"},
+                    {"name": "EV Bot", "difficulty": "expected_value"}
+                ]
+            }
+            response = requests.post(f"{self.api_url}/games", json=payload, timeout=10)
+            if response.status_code != 200:
+                return self.log_test("AI Opponent Game", False, f"Create status: {response.status_code}")
+            
+            ai_game_id = response.json().get('id')
+            requests.post(f"{self.api_url}/games/{ai_game_id}/roll",
+                          json={"game_id": ai_game_id, "held_dice": [False] * 5}, timeout=10)
+            response = requests.post(f"{self.api_url}/games/{ai_game_id}/score",
+                                     json={"game_id": ai_game_id, "category": "chance"}, timeout=10)
+            
+            if response.status_code == 200:
+                data = response.json()
+                bots = [player for player in data.get('players', []) if player.get('is_ai')]
+                bots_scored = all(
+                    sum(1 for category in ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes',
+                                           'three_of_a_kind', 'four_of_a_kind', 'full_house',
+                                           'small_straight', 'large_straight', 'yahtzee', 'chance']
+                        if bot['scorecard'].get(category) is not None) == 1
+                    for bot in bots
+                )
+                success = (
+                    len(bots) == 2 and
+                    bots_scored and
+                    data.get('current_player') == 0 and  # Back to the human after both bots played
+                    data.get('turn_number') == 2
+                )
+                return self.log_test("AI Opponent Game", success, f"Bot totals: {[bot['scorecard']['grand_total'] for bot in bots]}")
+            else:
+                return self.log_test("AI Opponent Game", False, f"Score status: {response.status_code}")
+        except Exception as e:
+            return self.log_test("AI Opponent Game", False, f"Error: {str(e)}")
+
+    def test_player_stats(self):
+        """Test that finishing a game updates the player's lifetime statistics"""
+        categories = ['ones', 'twos', 'threes', 'fours', 'fives', 'sixes',
+                      'three_of_a_kind', 'four_of_a_kind', 'full_house',
+                      'small_straight', 'large_straight', 'yahtzee', 'chance']
+        profile_id = f"stats-player-{int(time.time() * 1000)}"
+        
+        try:
+            payload = {"game_mode": "single", "player_names": ["Player 1"], "profile_ids": [profile_id]}
+            stats_game_id = requests.post(f"{self.api_url}/games", json=payload, timeout=10).json().get('id')
+            
+            data = {}
+            for category in categories:
+                requests.post(f"{self.api_url}/games/{stats_game_id}/roll",
+                              json={"game_id": stats_game_id, "held_dice": [False] * 5}, timeout=10)
+                time.sleep(0.25)  # Stay under the per-game rate limit
+                data = requests.post(f"{self.api_url}/games/{stats_game_id}/score",
+                                     json={"game_id": stats_game_id, "category": category}, timeout=10).json()
+                time.sleep(0.25)
+            
+            if not data.get('game_over'):
+                return self.log_test("Player Stats", False, "Game did not finish")
+            
+            final_score = data['players'][0]['scorecard']['grand_total']
+            response = requests.get(f"{self.api_url}/players/{profile_id}/stats", timeout=10)
+            if response.status_code == 200:
+                stats = response.json()
+                success = (
+                    stats.get('games_played') == 1 and
+                    stats.get('mean_score') == final_score and
+                    stats.get('score_variance') == 0 and
+                    len(stats.get('category_averages', {})) == len(categories)
+                )
+                return self.log_test("Player Stats", success, f"Games: {stats.get('games_played')}, mean: {stats.get('mean_score')}")
+            else:
+                return self.log_test("Player Stats", False, f"Status: {response.status_code}")
+        except Exception as e:
+            return self.log_test("Player Stats", False, f"Error: {str(e)}")
+
     def test_scoring_logic(self):
         """Test various scoring scenarios"""
         results = []
@@ -344,6 +489,305 @@ class YahtzeeAPITester:
         overall_success = len([r for r in results if r.startswith('✅')]) > 0
         return self.log_test("Error Handling", overall_success, f"\n  " + "\n  ".join(results))
 
+    def _latency_percentiles(self, samples):
+        """Return (p50, p99) in milliseconds"""
+        ordered = sorted(samples)
+        p50 = ordered[len(ordered) // 2] * 1000
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+        return p50, p99
+
+    def _run_in_process(self, benchmark):
+        """Run an async benchmark against the app in this process and shut it down afterwards
+
+        In-process clients get their own addresses, which a shared ingress would hide.
+        """
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        import server
+        
+        async def run():
+            try:
+                return await benchmark(server)
+            finally:
+                await server.shutdown_db_client()
+                # The Mongo client is bound to this event loop, so the next benchmark needs a new one
+                server.client = server.db = None
+        
+        return asyncio.run(run())
+
+    def _asgi_client(self, server, address):
+        transport = httpx.ASGITransport(app=server.app, client=(address, 50000))
+        return httpx.AsyncClient(transport=transport, base_url="http://yahtzee.test/api", timeout=30)
+
+    def test_rate_limit_under_flood(self):
+        """Benchmark well-behaved client latency while an abusive client floods the API"""
+        payload = {"game_mode": "single", "player_names": ["Test Player"]}
+        
+        async def benchmark(server):
+            async with self._asgi_client(server, "198.51.100.10") as victim, \
+                    self._asgi_client(server, "203.0.113.66") as abuser:
+                victim_ids = [(await victim.post("/games", json=payload)).json()['id'] for _ in range(4)]
+                abuser_id = (await abuser.post("/games", json=payload)).json()['id']
+                
+                async def measure(samples=120):
+                    latencies = []
+                    statuses = []
+                    for i in range(samples):
+                        start = time.perf_counter()
+                        response = await victim.get(f"/games/{victim_ids[i % len(victim_ids)]}/possible-scores")
+                        latencies.append(time.perf_counter() - start)
+                        statuses.append(response.status_code)
+                        # 8 requests/s spread over four games stays under the client and per-game limits
+                        await asyncio.sleep(0.125)
+                    return latencies, statuses
+                
+                baseline = await measure()
+                
+                stop = asyncio.Event()
+                flood_statuses = []
+                
+                async def flood():
+                    while not stop.is_set():
+                        response = await abuser.post(f"/games/{abuser_id}/roll",
+                                                     json={"game_id": abuser_id, "held_dice": [False] * 5})
+                        flood_statuses.append(response.status_code)
+                        await asyncio.sleep(0.02)  # Eight flooders at about 400 requests/s, 40x the client limit
+                
+                flooders = [asyncio.create_task(flood()) for _ in range(8)]
+                try:
+                    under_flood = await measure()
+                finally:
+                    stop.set()
+                    await asyncio.gather(*flooders)
+                return baseline, under_flood, flood_statuses
+        
+        try:
+            (baseline, baseline_statuses), (under_flood, flood_victim_statuses), flood_statuses = \
+                self._run_in_process(benchmark)
+            
+            base_p50, base_p99 = self._latency_percentiles(baseline)
+            flood_p50, flood_p99 = self._latency_percentiles(under_flood)
+            throttled = flood_statuses.count(429)
+            success = (
+                all(status == 200 for status in baseline_statuses + flood_victim_statuses) and
+                throttled > len(flood_statuses) * 0.9 and
+                flood_p99 <= max(base_p99, LATENCY_FLOOR_MS) * LATENCY_FACTOR
+            )
+            details = (
+                f"\n  Baseline p50/p99: {base_p50:.1f}/{base_p99:.1f} ms"
+                f"\n  Under flood p50/p99: {flood_p50:.1f}/{flood_p99:.1f} ms (limit {LATENCY_FACTOR}x baseline)"
+                f"\n  Abusive requests: {len(flood_statuses)}, throttled with 429: {throttled}"
+            )
+            return self.log_test("Rate Limit Under Flood", success, details)
+        except Exception as e:
+            return self.log_test("Rate Limit Under Flood", False, f"Error: {str(e)}")
+
+    def test_roll_latency_during_analysis(self):
+        """Benchmark /roll latency while back-to-back analysis requests keep every worker busy"""
+        payload = {"game_mode": "single", "player_names": ["Test Player"]}
+        
+        async def benchmark(server):
+            # Lift the rate limits so the analyzers can saturate the pool; they are not under test here
+            limits = [(limiter, limiter.rate, limiter.burst) for limiter in (server.client_limiter, server.game_limiter)]
+            for limiter, _, _ in limits:
+                limiter.rate = limiter.burst = 1e9
+            await server.analysis_pool.warm()
+            workers = server.analysis_pool.workers
+            
+            async def measure_rolls(client, samples=40):
+                latencies = []
+                busy = 0
+                for _ in range(samples):
+                    game_id = (await client.post("/games", json=payload)).json()['id']
+                    busy += server.analysis_pool.pending >= workers
+                    start = time.perf_counter()
+                    response = await client.post(f"/games/{game_id}/roll",
+                                                 json={"game_id": game_id, "held_dice": [False] * 5})
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"Roll status: {response.status_code}")
+                    await asyncio.sleep(0.05)
+                return latencies, busy / samples
+            
+            stop = asyncio.Event()
+            analysis_statuses = []
+            
+            async def analyze(worker):
+                async with self._asgi_client(server, f"198.51.100.{100 + worker}") as client:
+                    game_id = (await client.post("/games", json=payload)).json()['id']
+                    await client.post(f"/games/{game_id}/roll", json={"game_id": game_id, "held_dice": [False] * 5})
+                    while not stop.is_set():
+                        response = await client.get(f"/games/{game_id}/analysis")
+                        analysis_statuses.append(response.status_code)
+            
+            try:
+                async with self._asgi_client(server, "198.51.100.10") as player:
+                    baseline, _ = await measure_rolls(player)
+                    # Two analyzers per worker, so a new analysis is always queued when one finishes
+                    analyzers = [asyncio.create_task(analyze(worker)) for worker in range(workers * 2)]
+                    try:
+                        during_analysis, busy = await measure_rolls(player)
+                    finally:
+                        stop.set()
+                        await asyncio.gather(*analyzers)
+            finally:
+                for limiter, rate, burst in limits:
+                    limiter.rate, limiter.burst = rate, burst
+            return baseline, during_analysis, busy, analysis_statuses
+        
+        try:
+            baseline, during_analysis, busy, analysis_statuses = self._run_in_process(benchmark)
+            
+            base_p50, base_p99 = self._latency_percentiles(baseline)
+            busy_p50, busy_p99 = self._latency_percentiles(during_analysis)
+            success = (
+                analysis_statuses and all(status == 200 for status in analysis_statuses) and
+                busy >= 0.9 and
+                busy_p99 <= max(base_p99, LATENCY_FLOOR_MS) * LATENCY_FACTOR
+            )
+            details = (
+                f"\n  Baseline /roll p50/p99: {base_p50:.1f}/{base_p99:.1f} ms"
+                f"\n  During analysis /roll p50/p99: {busy_p50:.1f}/{busy_p99:.1f} ms (limit {LATENCY_FACTOR}x baseline)"
+                f"\n  Analysis requests completed: {analysis_statuses.count(200)}/{len(analysis_statuses)}, "
+                f"pool saturated for {busy:.0%} of rolls"
+            )
+            return self.log_test("Roll Latency During Analysis", success, details)
+        except Exception as e:
+            return self.log_test("Roll Latency During Analysis", False, f"Error: {str(e)}")
+
+    def test_startup_time(self):
+        """Benchmark a cold import of the backend module and building the app"""
+        backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+        script = (
+            "import sys, time\n"
+            "started = time.perf_counter()\n"
+            "import server\n"
+            "imported = time.perf_counter()\n"
+            "server.app\n"
+            "built = time.perf_counter()\n"
+            "print(imported - started, built - imported, 'motor' in sys.modules, server.client is None)\n"
+        )
+        try:
+            import_times = []
+            build_times = []
+            lazy = True
+            for _ in range(5):
+                result = subprocess.run([sys.executable, "-c", script], cwd=backend_dir,
+                                        capture_output=True, text=True, timeout=60)
+                if result.returncode != 0:
+                    return self.log_test("Startup Time", False, f"Import failed: {result.stderr.strip()[-200:]}")
+                import_time, build_time, motor_loaded, client_unset = result.stdout.split()
+                import_times.append(float(import_time) * 1000)
+                build_times.append(float(build_time) * 1000)
+                lazy = lazy and motor_loaded == "False" and client_unset == "True"
+            
+            import_times.sort()
+            build_times.sort()
+            details = (
+                f"\n  Import median/max: {import_times[2]:.0f}/{import_times[-1]:.0f} ms"
+                f"\n  App construction median: {build_times[2]:.1f} ms"
+                f"\n  Mongo client deferred: {lazy}"
+            )
+            return self.log_test("Startup Time", lazy, details)
+        except Exception as e:
+            return self.log_test("Startup Time", False, f"Error: {str(e)}")
+
+    def test_wire_format_benchmark(self):
+        """Benchmark payload size and encode/decode time of JSON against the binary game encoding"""
+        try:
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+            import server
+            
+            # A two player game halfway through
+            game_state = server.GameState(game_mode="multiplayer", players=[
+                server.Player(name="Test Player", is_ai=True, ai_difficulty="greedy"),
+                server.Player(name="Other Player", is_ai=True, ai_difficulty="greedy")
+            ])
+            for _ in range(12):
+                server.YahtzeeAI.play_turn(game_state)
+            server.apply_roll(game_state, [False] * 5)
+            
+            iterations = 5000
+            
+            def per_call_us(fn, arg):
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    fn(arg)
+                return (time.perf_counter() - start) / iterations * 1e6
+            
+            json_body = server.serialize_game(game_state)
+            binary_body = server.encode_game_binary(game_state)
+            json_encode = per_call_us(server.serialize_game, game_state)
+            binary_encode = per_call_us(server.encode_game_binary, game_state)
+            json_decode = per_call_us(json.loads, json_body)
+            binary_decode = per_call_us(server.decode_game_binary, binary_body)
+            
+            decoded = server.decode_game_binary(binary_body)
+            expected = json.loads(json_body)
+            success = (
+                decoded['dice'] == expected['dice'] and
+                [player['scorecard'] for player in decoded['players']] ==
+                [player['scorecard'] for player in expected['players']] and
+                len(binary_body) < len(json_body)
+            )
+            details = (
+                f"\n  Payload: JSON {len(json_body)} bytes, binary {len(binary_body)} bytes"
+                f"\n  Encode: JSON {json_encode:.1f} us, binary {binary_encode:.1f} us"
+                f"\n  Decode: JSON {json_decode:.1f} us, binary {binary_decode:.1f} us"
+            )
+            return self.log_test("Wire Format Benchmark", success, details)
+        except Exception as e:
+            return self.log_test("Wire Format Benchmark", False, f"Error: {str(e)}")
+
+    def test_replay_verification(self):
+        """Test that replaying a recorded game matches it, and that tampering and engine errors are reported"""
+        try:
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+            import replay
+            import server
+
+            game_state = server.GameState(players=[
+                server.Player(name="Test Player", is_ai=True, ai_difficulty="greedy")
+            ], action_log_complete=True)
+            while not game_state.game_over:
+                server.YahtzeeAI.play_turn(game_state)
+            # The stored document, as a dump of the games collection would hold it
+            game = json.loads(json.dumps(game_state.dict(), default=str))
+            clean = replay.replay_game(game)
+
+            tampered_game = json.loads(json.dumps(game))
+            tampered_game["players"][0]["scorecard"]["chance"] += 1
+            tampered = replay.replay_game(tampered_game)
+
+            # A game that was already in progress when logging began only has its totals checked
+            partial_game = json.loads(json.dumps(game))
+            partial_game["action_log_complete"] = False
+            partial_game["action_log"] = partial_game["action_log"][len(partial_game["action_log"]) // 2:]
+            partial = replay.replay_game(partial_game)
+
+            # Malformed lines are unreadable input; an exception from the engine is a mismatch
+            original_apply_score = replay.apply_score
+            def broken_apply_score(game_state, category):
+                raise KeyError(category)
+            replay.apply_score = broken_apply_score
+            try:
+                games, unreadable, mismatches = replay.replay_batch(
+                    [json.dumps(game), "{not json", json.dumps({"players": "none"})]
+                )
+            finally:
+                replay.apply_score = original_apply_score
+
+            success = (
+                clean == [] and
+                any("chance" in diff for diff in tampered) and
+                partial == [] and
+                (games, unreadable) == (3, 2) and
+                len(mismatches) == 1 and "engine error" in mismatches[0][1][0]
+            )
+            return self.log_test("Replay Verification", success,
+                                 f"Clean: {clean}, tampered: {tampered}, unreadable: {unreadable}")
+        except Exception as e:
+            return self.log_test("Replay Verification", False, f"Error: {str(e)}")
+
     def run_all_tests(self):
         """Run all backend API tests"""
         print("🎲 Starting Yahtzee Backend API Tests")
@@ -351,16 +795,22 @@ class YahtzeeAPITester:
         
         # Basic API tests
         self.test_api_root()
+        self.test_readiness()
         self.test_create_single_player_game()
         self.test_create_multiplayer_game()
         self.test_get_game()
+        self.test_etag_polling()
+        self.test_binary_game_format()
         
         # Game mechanics tests
         self.test_roll_dice()
         self.test_roll_with_held_dice()
         self.test_get_possible_scores()
         self.test_score_category()
+        self.test_ai_opponent_game()
+        self.test_player_stats()
         self.test_scoring_logic()
+        self.test_replay_verification()
         
         # High score tests
         self.test_high_score_system()
@@ -369,6 +819,12 @@ class YahtzeeAPITester:
         # Error handling tests
         self.test_error_handling()
         
+        # Performance benchmarks
+        self.test_startup_time()
+        self.test_rate_limit_under_flood()
+        self.test_roll_latency_during_analysis()
+        self.test_wire_format_benchmark()
+        
         # Print summary
         print("\n" + "=" * 50)
         print(f"📊 Test Results: {self.tests_passed}/{self.tests_run} tests passed")